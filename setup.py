@@ -7,9 +7,10 @@ setup(
     url="https://github.com/AfricasVoices/SocialMediaTools",
     packages=find_packages(exclude=("test",)),
     install_requires=[
-        "pytz",
+        "brotli",
+        "orjson",
         "requests",
-        "python-dateutil",
+        "ciso8601",
         "coredatamodules @ git+https://github.com/AfricasVoices/CoreDataModules"
     ]
 )
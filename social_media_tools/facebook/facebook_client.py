@@ -1,20 +1,101 @@
+import functools
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
 
-import pytz
+import orjson
 import requests
 from core_data_modules.logging import Logger
+from requests.adapters import HTTPAdapter
 
 log = Logger(__name__)
 
 _BASE_URL = "https://graph.facebook.com/v8.0"
 _MAX_RESULTS_PER_PAGE = 100  # For paged requests, the maximum number of records to request in each page
+# For paged requests which use field expansion to include other edges of each record (e.g. comments on posts), the
+# maximum number of records to request in each page. This is much smaller than _MAX_RESULTS_PER_PAGE because each
+# record can include up to _MAX_RESULTS_PER_PAGE nested records, and Facebook rejects responses which are too large.
+_MAX_EXPANDED_RESULTS_PER_PAGE = 10
+_MAX_REQUESTS_PER_BATCH = 50  # For batch requests, the maximum number of sub-requests Facebook accepts in one batch
+_UTC = timezone.utc
+
+# Retry policy for transient failures. Failures caused by rate-limiting start from a much longer backoff, because
+# Facebook's rate limits are calculated over windows of up to an hour.
+_MAX_RETRIES = 5
+_INITIAL_BACKOFF_SECONDS = 1
+_RATE_LIMIT_INITIAL_BACKOFF_SECONDS = 60
+
+# Graph API error codes which indicate a request was rate-limited.
+# See https://developers.facebook.com/docs/graph-api/using-graph-api/error-handling
+# and https://developers.facebook.com/docs/graph-api/overview/rate-limiting
+_RATE_LIMIT_ERROR_CODES = {4, 17, 32, 341, 613} | set(range(80001, 80015))
+# Graph API error codes which indicate a temporary problem with Facebook, that is worth retrying.
+_TRANSIENT_ERROR_CODES = {2} | _RATE_LIMIT_ERROR_CODES
+
+
+@functools.lru_cache(maxsize=128)
+def _join_fields_tuple(fields):
+    return ",".join(fields)
+
+
+def _join_fields(fields):
+    """
+    Joins a collection of fields (or metrics) into the comma-separated format expected by Facebook's APIs.
+
+    Joins of tuples, which include all the default fields arguments in this module, are cached, because the same
+    fields are typically requested many times.
+
+    :param fields: Fields to join.
+    :type fields: iterable of str
+    :return: `fields`, comma-separated.
+    :rtype: str
+    """
+    if isinstance(fields, tuple):
+        return _join_fields_tuple(fields)
+    return ",".join(fields)
 
 
 class FacebookError(Exception):
-    def __init__(self, message):
+    def __init__(self, message, code=None, http_status=None, is_transient=False):
+        """
+        :param message: Description of the error, or the error response returned by Facebook.
+        :type message: str | dict
+        :param code: Graph API error code, if this error was returned by the Graph API.
+        :type code: int | None
+        :param http_status: HTTP status of the response that failed, if known.
+        :type http_status: int | None
+        :param is_transient: Whether Facebook reported this error as transient, meaning the request may succeed if
+                             it is retried.
+        :type is_transient: bool
+        """
         self.message = message
-        super().__init__(self, message)
+        self.code = code
+        self.http_status = http_status
+        self._is_transient = is_transient
+        super().__init__(message)
+
+    @property
+    def is_rate_limit(self):
+        """
+        :return: Whether this error was caused by the request being rate-limited.
+        :rtype: bool
+        """
+        return self.code in _RATE_LIMIT_ERROR_CODES or (self.code is None and self.http_status == 429)
+
+    @property
+    def is_transient(self):
+        """
+        :return: Whether the request that caused this error may succeed if it is retried.
+        :rtype: bool
+        """
+        if self._is_transient or self.code in _TRANSIENT_ERROR_CODES:
+            return True
+        # Errors without a Graph API error code come from Facebook's servers failing before the Graph API could
+        # produce an error response, so can only be classified by their HTTP status.
+        return self.code is None and self.http_status is not None and \
+            (self.http_status == 429 or self.http_status >= 500)
 
 
 class FacebookClient(object):
@@ -23,9 +104,30 @@ class FacebookClient(object):
         :param access_token: Facebook access token.
         :type access_token: str
         """
-        self._access_token = access_token
+        # Share one session (and therefore one connection pool) between all requests made by this client, so that
+        # keep-alive connections to the Graph API are reused rather than re-negotiating TLS on every request.
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        # requests.Session isn't guaranteed to be thread-safe, but the paging helpers prefetch pages on a background
+        # thread while callers may still be using this client, so all use of the session is serialised by this lock.
+        self._session_lock = threading.Lock()
+        # Authenticate every request made through the session.
+        self._session.params = {"access_token": access_token}
+
+    def close(self):
+        """
+        Closes the underlying HTTP session, releasing any pooled connections.
+        """
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def _date_to_facebook_time(date):
         """
         Converts a datetime into a format compatible with Facebook's API.
@@ -37,67 +139,282 @@ class FacebookClient(object):
         :return: `date` in a format compatible with Facebook's APIs.
         :rtype: str
         """
-        return date.astimezone(pytz.utc).isoformat().replace("+00:00", "Z")
+        utc_date = date.astimezone(_UTC)
+        if utc_date.microsecond == 0:
+            return utc_date.strftime("%Y-%m-%dT%H:%M:%SZ")
+        return utc_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
     @staticmethod
-    def _validate_response(response):
+    def _validate_response(response_json, http_status=None):
+        """
+        Ensures the response json does not contain an 'error' field. Fails with a FacebookError if it does.
+
+        :param response_json: Parsed json body of a response from a Facebook API to validate.
+        :type response_json: dict
+        :param http_status: HTTP status of the response, if known.
+        :type http_status: int | None
         """
-        Ensures the response json contains a 'data' field. Fails with an AssertionError if it does not.
+        if "error" in response_json:
+            error = response_json["error"]
+            raise FacebookError(response_json, code=error.get("code"), http_status=http_status,
+                                is_transient=error.get("is_transient", False))
+
+    @classmethod
+    def _parse_response(cls, response):
+        """
+        Parses the json body of a response from a Facebook API, and validates it with
+        `FacebookClient._validate_response`.
+
+        Fails with a FacebookError if the body is not json, which happens when Facebook's servers fail before the
+        Graph API can produce an error response (e.g. on some 5xx errors).
+
+        :param response: Response from a Facebook API to parse.
+        :type response: requests.Response
+        :return: Parsed json body of `response`.
+        :rtype: dict | list
+        """
+        log.debug(f"Received response with Content-Encoding '{response.headers.get('Content-Encoding')}'")
+        try:
+            # Decode the raw bytes with orjson, which is much faster than `response.json()` for large pages, and
+            # avoids requests guessing the body's encoding first.
+            response_json = orjson.loads(response.content)
+        except ValueError:
+            raise FacebookError(f"Response with HTTP status {response.status_code} did not contain json",
+                                http_status=response.status_code)
+        if isinstance(response_json, dict):
+            cls._validate_response(response_json, response.status_code)
+
+        return response_json
 
-        :param response: Response from a Facebook API to validate.
-        :type response: Response
+    @staticmethod
+    def _is_transient(ex):
+        """
+        :param ex: Exception raised while making a request to Facebook.
+        :type ex: Exception
+        :return: Whether the request that raised `ex` may succeed if it is retried.
+        :rtype: bool
         """
-        if "error" in response.json():
-            raise FacebookError(response.json())
+        if isinstance(ex, FacebookError):
+            return ex.is_transient
+        # Only retry requests that failed in transit. Other RequestExceptions e.g. InvalidURL will never succeed.
+        return isinstance(ex, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
 
     @classmethod
-    def _auto_retry(cls, f, max_retries=3, backoff_seconds=1):
+    def _auto_retry(cls, f, max_retries=_MAX_RETRIES, backoff_seconds=_INITIAL_BACKOFF_SECONDS):
         try:
             return f()
-        except FacebookError as ex:
-            log.warning(f"Facebook request failed with error {ex.message}")
+        except (FacebookError, requests.RequestException) as ex:
+            log.warning(f"Facebook request failed with error {ex}")
+
+            if not cls._is_transient(ex):
+                log.error(f"Not retrying, because this error is not transient")
+                raise ex
 
             if max_retries == 0:
                 log.error(f"Retried the maximum number of times")
                 raise ex
 
+            if isinstance(ex, FacebookError) and ex.is_rate_limit:
+                backoff_seconds = max(backoff_seconds, _RATE_LIMIT_INITIAL_BACKOFF_SECONDS)
+
             log.info(f"Retrying up to {max_retries} more times, after {backoff_seconds} seconds...")
             time.sleep(backoff_seconds)
             return cls._auto_retry(f, max_retries - 1, backoff_seconds * 2)
 
-    def _make_get_request(self, endpoint, params=None):
-        if params is None:
-            params = {}
-        params = params.copy()
-        params["access_token"] = self._access_token
+    def _request(self, method, url, **kwargs):
+        """
+        Makes a request using this client's session, and parses the response with `FacebookClient._parse_response`.
+
+        :param method: HTTP method to use e.g. "GET".
+        :type method: str
+        :param url: Url to request.
+        :type url: str
+        :param kwargs: Keyword arguments to pass to `requests.Session.request`.
+        :return: Parsed json body of the response.
+        :rtype: dict | list
+        """
+        with self._session_lock:
+            response = self._session.request(method, url, **kwargs)
+        return self._parse_response(response)
 
+    def _make_get_request(self, endpoint, params=None):
         url = f"{_BASE_URL}{endpoint}"
-        response = requests.get(url, params)
-        self._validate_response(response)
+        response_json = self._request("GET", url, params=params)
 
-        return response.json()
+        return response_json
 
     def _make_paged_get_request(self, endpoint, params=None):
-        if params is None:
-            params = {}
-        params = params.copy()
-        params["access_token"] = self._access_token
+        # Build the result with one `list` call over all the pages rather than pre-sizing it from a `summary=true`
+        # total_count: Facebook's counts include records that aren't returned (e.g. hidden comments), so aren't
+        # reliable enough to allocate from, and `list` already sizes its storage efficiently as it consumes pages.
+        return list(self._iter_paged_get_request(endpoint, params))
 
-        url = f"{_BASE_URL}{endpoint}"
-        response = requests.get(url, params)
-        self._validate_response(response)
+    def _iter_paged_get_request(self, endpoint, params=None):
+        """
+        Iterates over the data returned by a paged request, fetching each page only as it is needed.
+
+        Each page is retried independently, so a failed request does not discard the pages that were already read.
+
+        :param endpoint: Endpoint to request, relative to the Graph API version root e.g. "/<post-id>/comments".
+        :type endpoint: str
+        :param params: Query parameters to include in the request for the first page, or None.
+        :type params: dict | None
+        :return: Iterator over the data in all pages of the response.
+        :rtype: iterator
+        """
+        response_json = self._auto_retry(lambda: self._make_get_request(endpoint, params))
+        return self._iter_pages(response_json)
+
+    def _get_next_page(self, next_url):
+        # The next url already contains the access token, so prevent the session from adding it again.
+        response_json = self._request("GET", next_url, params={"access_token": None})
 
-        result = response.json()["data"]
-        next_url = response.json().get("paging", {}).get("next")
-        while next_url is not None:
-            response = requests.get(next_url)
-            self._validate_response(response)
+        return response_json
+
+    def _iter_pages(self, response_json):
+        """
+        Iterates over the data in the given page of results, and in all the pages that follow it.
+
+        :param response_json: First page of a paged response, as a dict containing 'data' and optionally 'paging'.
+        :type response_json: dict
+        :return: Iterator over the data in `response_json` followed by the data in all subsequent pages.
+        :rtype: iterator
+        """
+        # Facebook's paging cursors are opaque, so pages can't be requested in parallel. Instead, start fetching the
+        # next page in the background as soon as its url is known, and yield the current page while that is in
+        # flight. The background fetch is only attempted once, so that it never sleeps between retries; if it fails,
+        # it's retried on this thread when the next page is actually needed.
+        executor = ThreadPoolExecutor(max_workers=1)
+        next_response = None
+        try:
+            while True:
+                next_url = response_json.get("paging", {}).get("next")
+                if next_url is not None:
+                    next_response = executor.submit(self._get_next_page, next_url)
+
+                yield from response_json["data"]
+
+                if next_response is None:
+                    return
+                try:
+                    response_json = next_response.result()
+                except (FacebookError, requests.RequestException) as ex:
+                    if not self._is_transient(ex):
+                        raise ex
+                    log.warning(f"Prefetching the next page failed with error {ex}")
+                    response_json = self._auto_retry(functools.partial(self._get_next_page, next_url))
+                next_response = None
+        finally:
+            # If the consumer stopped iterating early, don't make it wait for a page it will never read.
+            if next_response is not None:
+                next_response.cancel()
+            executor.shutdown(wait=False)
+
+    def _make_batch_request(self, relative_urls):
+        """
+        Makes a single batch request to Facebook, containing a GET sub-request for each of the given relative urls.
+
+        Fails with a FacebookError if the batch request as a whole fails. Failures of individual sub-requests are
+        returned in place of their results, so that one bad sub-request does not fail all the others.
+
+        :param relative_urls: Urls to GET, relative to the Graph API version root e.g. "<post-id>?fields=message".
+                              There must be no more than _MAX_REQUESTS_PER_BATCH urls.
+        :type relative_urls: list of str
+        :return: For each sub-request, in the same order as `relative_urls`, either its parsed json body or
+                 the FacebookError it failed with.
+        :rtype: list of (dict | FacebookError)
+        """
+        assert len(relative_urls) <= _MAX_REQUESTS_PER_BATCH, \
+            f"Facebook only accepts up to {_MAX_REQUESTS_PER_BATCH} requests per batch, but {len(relative_urls)} " \
+            f"were requested"
+
+        batch = [{"method": "GET", "relative_url": relative_url} for relative_url in relative_urls]
+        response_json = self._request("POST", f"{_BASE_URL}/", data={
+            "include_headers": "false",
+            "batch": orjson.dumps(batch)
+        })
+
+        results = []
+        for relative_url, sub_response in zip(relative_urls, response_json):
+            # Facebook returns null in place of a sub-response if that sub-request timed out.
+            if sub_response is None:
+                results.append(FacebookError(f"Sub-request '{relative_url}' timed out", is_transient=True))
+                continue
+            try:
+                sub_response_json = orjson.loads(sub_response["body"])
+            except ValueError:
+                http_status = sub_response.get("code")
+                results.append(FacebookError(f"Sub-request '{relative_url}' with HTTP status {http_status} did not "
+                                             f"contain json", http_status=http_status))
+                continue
+            try:
+                self._validate_response(sub_response_json, sub_response.get("code"))
+            except FacebookError as ex:
+                results.append(ex)
+                continue
+            results.append(sub_response_json)
+        return results
+
+    def _make_batched_get_requests(self, relative_urls):
+        """
+        Makes GET requests to all the given relative urls, using as few batch requests as possible.
+
+        Sub-requests which fail with transient errors are retried in later batches, without repeating the
+        sub-requests that succeeded. Sub-requests which fail permanently, or run out of retries, are not retried.
+
+        :param relative_urls: Urls to GET, relative to the Graph API version root.
+        :type relative_urls: list of str
+        :return: For each request, in the same order as `relative_urls`, either its parsed json body or the
+                 FacebookError it failed with.
+        :rtype: list of (dict | FacebookError)
+        """
+        results = [None] * len(relative_urls)
+        for chunk_start in range(0, len(relative_urls), _MAX_REQUESTS_PER_BATCH):
+            pending = list(range(chunk_start, min(chunk_start + _MAX_REQUESTS_PER_BATCH, len(relative_urls))))
+
+            def make_pending_requests():
+                sub_results = self._make_batch_request([relative_urls[i] for i in pending])
+                still_pending = []
+                for i, sub_result in zip(pending, sub_results):
+                    results[i] = sub_result
+                    if isinstance(sub_result, FacebookError) and sub_result.is_transient:
+                        still_pending.append(i)
+                pending[:] = still_pending
+
+                # Raise one of the transient errors, so that `_auto_retry` retries the requests that are still
+                # pending after an appropriate backoff.
+                if len(pending) > 0:
+                    raise results[pending[0]]
+
+            try:
+                self._auto_retry(make_pending_requests)
+            except FacebookError as ex:
+                # If the retries ran out on a sub-request's error, that error is already recorded in `results`.
+                # Otherwise, the last batch request failed as a whole, so record that failure against every request
+                # it contained, replacing any stale errors from earlier attempts.
+                if len(pending) == 0 or ex is not results[pending[0]]:
+                    for i in pending:
+                        results[i] = ex
+
+        return results
+
+    @staticmethod
+    def _raise_for_failed_posts(post_ids, results):
+        """
+        Fails with a FacebookError naming every post whose batched request failed, if there were any.
 
-            result.extend(response.json()["data"])
-            next_url = response.json()["paging"].get("next")
-        return result
+        :param post_ids: Ids of the posts that were requested.
+        :type post_ids: list of str
+        :param results: Results of the batched requests for each post, as returned by
+                        `FacebookClient._make_batched_get_requests`.
+        :type results: list of (dict | FacebookError)
+        """
+        failures = {post_id: result.message for post_id, result in zip(post_ids, results)
+                    if isinstance(result, FacebookError)}
+        if len(failures) > 0:
+            raise FacebookError(f"Requests for {len(failures)} of {len(post_ids)} posts failed: {failures}")
 
-    def get_post(self, post_id, fields=["created_time", "message", "id"]):
+    def get_post(self, post_id, fields=("created_time", "message", "id")):
         """
         Gets the post with the given id.
 
@@ -113,12 +430,12 @@ class FacebookClient(object):
         return self._auto_retry(lambda: self._make_get_request(
             f"/{post_id}",
             {
-                "fields": ",".join(fields)
+                "fields": _join_fields(fields)
             }
         ))
 
-    def get_posts_published_by_page(self, page_id, fields=["attachments", "created_time", "message"],
-                                    created_after=None, created_before=None):
+    def get_posts_published_by_page(self, page_id, fields=("created_time", "message"),
+                                    created_after=None, created_before=None, comment_fields=None, metrics=None):
         """
         Gets posts published by the given page.
 
@@ -126,6 +443,8 @@ class FacebookClient(object):
         :type page_id: str
         :param fields: Fields to include in the returned dict. `id` will always be included, even if not specified.
                        For available fields, see https://developers.facebook.com/docs/graph-api/reference/page-post.
+                       Attachments are not requested by default because they are expensive for Facebook to return.
+                       To request only some attachment fields, use sub-field syntax e.g. "attachments{type}".
         :type fields: iterable of str
         :param created_after: Start of the date-range to download posts from, by post created_on time, or None.
                               If None, posts will be downloaded from the beginning of time.
@@ -133,6 +452,15 @@ class FacebookClient(object):
         :param created_before: End of the date-range to download posts from, by post created_on time, or None.
                                If None, posts will be downloaded until the end of time.
         :type created_before: datetime.datetime | None
+        :param comment_fields: If not None, also fetches all the comments on each post in the same request as the
+                               posts, and includes them in each post under the key 'comments', as a list of dicts
+                               containing the keys in `comment_fields`. This is equivalent to, but needs far fewer
+                               requests than, calling `FacebookClient.get_all_comments_on_post` for each post.
+        :type comment_fields: iterable of str | None
+        :param metrics: If not None, also fetches these metrics for each post in the same request as the posts, and
+                        includes them in each post under the key 'insights', in the format returned by
+                        `FacebookClient.get_raw_metrics_for_post`.
+        :type metrics: iterable of str | None
         :return: Posts published by page with id `page_id`, as a list of dicts containing the keys in `fields`.
         :rtype: list of dict
         """
@@ -143,24 +471,71 @@ class FacebookClient(object):
             log_str += f", created after {created_before.isoformat()}"
         log.debug(f"{log_str}...")
 
+        # Use field expansion to fetch the requested edges of each post in the same request as the posts themselves.
+        # See https://developers.facebook.com/docs/graph-api/field-expansion
+        fields = tuple(fields)
+        if comment_fields is not None:
+            fields += (f"comments.limit({_MAX_RESULTS_PER_PAGE}).filter(stream){{{_join_fields(comment_fields)}}}",)
+        if metrics is not None:
+            fields += (f"insights.metric({_join_fields(metrics)})",)
+
         params = {
-            "fields": ",".join(fields),
-            "limit": _MAX_RESULTS_PER_PAGE
+            "fields": _join_fields(fields),
+            "limit": _MAX_RESULTS_PER_PAGE if comment_fields is None and metrics is None
+            else _MAX_EXPANDED_RESULTS_PER_PAGE
         }
         if created_after is not None:
             params["since"] = self._date_to_facebook_time(created_after)
         if created_before is not None:
             params["until"] = self._date_to_facebook_time(created_before)
 
-        posts = self._auto_retry(lambda: self._make_paged_get_request(
+        posts = self._make_paged_get_request(
             f"/{page_id}/published_posts",
             params
-        ))
+        )
         log.info(f"Fetched {len(posts)} posts")
 
+        if comment_fields is not None:
+            # Facebook omits the comments edge from posts with no comments, and only returns the first page of
+            # comments for the others, so fetch the remaining pages only for the posts that have more.
+            for post in posts:
+                if "comments" not in post:
+                    post["comments"] = []
+                    continue
+                post["comments"] = list(self._iter_pages(post["comments"]))
+            log.info(f"Fetched {sum(len(post['comments']) for post in posts)} comments on the fetched posts")
+
+        if metrics is not None:
+            for post in posts:
+                post["insights"] = post.get("insights", {}).get("data", [])
+
         return posts
 
-    def get_all_comments_on_post(self, post_id, fields=["parent", "attachments", "created_time", "message"],
+    def get_posts_with_attachment_types(self, page_id, created_after=None, created_before=None):
+        """
+        Gets posts published by the given page, including just the type of each of their attachments.
+
+        The returned posts can be passed to `facebook_utils.clean_post_type`, and are much smaller to download than
+        posts requested with all of their attachments' fields.
+
+        :param page_id: Id of the page to download all the posts from.
+        :type page_id: str
+        :param created_after: Start of the date-range to download posts from, by post created_on time, or None.
+                              If None, posts will be downloaded from the beginning of time.
+        :type created_after: datetime.datetime | None
+        :param created_before: End of the date-range to download posts from, by post created_on time, or None.
+                               If None, posts will be downloaded until the end of time.
+        :type created_before: datetime.datetime | None
+        :return: Posts published by page with id `page_id`, as a list of dicts containing the keys 'id' and
+                 'created_time', and the keys 'message' and 'attachments' for posts which have them.
+        :rtype: list of dict
+        """
+        return self.get_posts_published_by_page(
+            page_id, fields=("created_time", "message", "attachments{type}"),
+            created_after=created_after, created_before=created_before
+        )
+
+    def get_all_comments_on_post(self, post_id, fields=("parent", "created_time", "message"),
                                  raw_export_log_file=None):
         """
         Gets all the comments on a post that are visible to this user, including comments which are replies to
@@ -170,21 +545,25 @@ class FacebookClient(object):
         :type post_id: str
         :param fields: Fields to include in the returned dict. `id` will always be included, even if not specified.
                        For available fields, see https://developers.facebook.com/docs/graph-api/reference/comment.
+                       Attachments are not requested by default because they are expensive for Facebook to return.
+                       To request only some attachment fields, use sub-field syntax e.g. "attachments{type,url}".
         :type fields: iterable of str
-        :param raw_export_log_file: File to write the raw data downloaded during this function call to as json.
+        :param raw_export_log_file: File to write the raw data downloaded during this function call to, as a single
+                                    line containing a json list of all the comments. Note this differs from the
+                                    format written by `FacebookClient.iter_all_comments_on_post`.
         :type raw_export_log_file: file-like | None
         :return: Comments on the post with id `post_id`, as a list of dicts containing the keys in `fields`.
         :rtype: list of dict
         """
         log.info(f"Fetching all comments on post '{post_id}'...")
-        comments = self._auto_retry(lambda: self._make_paged_get_request(
+        comments = self._make_paged_get_request(
             f"/{post_id}/comments",
             {
-                "fields": ",".join(fields),
+                "fields": _join_fields(fields),
                 "limit": _MAX_RESULTS_PER_PAGE,
                 "filter": "stream"
             }
-        ))
+        )
         log.info(f"Fetched {len(comments)} comments")
 
         if raw_export_log_file is not None:
@@ -197,6 +576,72 @@ class FacebookClient(object):
 
         return comments
 
+    def iter_all_comments_on_post(self, post_id, fields=("parent", "created_time", "message"),
+                                  raw_export_log_file=None):
+        """
+        Iterates over all the comments on a post that are visible to this user, including comments which are replies
+        to other comments.
+
+        Unlike `FacebookClient.get_all_comments_on_post`, comments are downloaded a page at a time as they are
+        consumed, so only one page of comments needs to be held in memory at once.
+
+        :param post_id: Post to download the comments from.
+        :type post_id: str
+        :param fields: Fields to include in the returned dicts. `id` will always be included, even if not specified.
+                       For available fields, see https://developers.facebook.com/docs/graph-api/reference/comment.
+                       See `FacebookClient.get_all_comments_on_post` for how to request attachments.
+        :type fields: iterable of str
+        :param raw_export_log_file: File to write the raw data downloaded during this function call to, as one line
+                                    containing a json object per comment (JSON Lines). Note this differs from the
+                                    single json list per call written by `FacebookClient.get_all_comments_on_post`.
+        :type raw_export_log_file: file-like | None
+        :return: Iterator over the comments on the post with id `post_id`, as dicts containing the keys in `fields`.
+        :rtype: iterator of dict
+        """
+        log.info(f"Streaming all comments on post '{post_id}'...")
+        if raw_export_log_file is None:
+            log.debug("Not logging the raw export (argument 'raw_export_log_file' was None)")
+
+        comments = self._iter_paged_get_request(
+            f"/{post_id}/comments",
+            {
+                "fields": _join_fields(fields),
+                "limit": _MAX_RESULTS_PER_PAGE,
+                "filter": "stream"
+            }
+        )
+
+        comments_count = 0
+        for comment in comments:
+            if raw_export_log_file is not None:
+                json.dump(comment, raw_export_log_file)
+                raw_export_log_file.write("\n")
+            comments_count += 1
+            yield comment
+        log.info(f"Streamed {comments_count} comments")
+
+    def get_posts(self, post_ids, fields=("created_time", "message", "id")):
+        """
+        Gets the posts with the given ids, using batch requests to fetch up to 50 posts per request.
+
+        :param post_ids: Ids of posts to download.
+        :type post_ids: iterable of str
+        :param fields: Fields to include in the returned dicts. `id` will always be included, even if not specified.
+                       For available fields, see https://developers.facebook.com/docs/graph-api/reference/page-post.
+        :type fields: iterable of str
+        :return: Posts with ids `post_ids`, as dicts containing the keys in `fields`, in the same order as `post_ids`.
+                 Fails with a FacebookError naming the posts that could not be fetched, if there were any.
+        :rtype: list of dict
+        """
+        post_ids = list(post_ids)
+        log.info(f"Fetching {len(post_ids)} posts...")
+        fields_str = _join_fields(fields)
+        posts = self._make_batched_get_requests([f"{post_id}?fields={fields_str}" for post_id in post_ids])
+        self._raise_for_failed_posts(post_ids, posts)
+        log.info(f"Fetched {len(posts)} posts")
+
+        return posts
+
     def get_raw_metrics_for_post(self, post_id, metrics):
         """
         Gets the raw metrics on a post in the full format returned by Facebook.
@@ -212,7 +657,7 @@ class FacebookClient(object):
         :rtype: list of dict
         """
         return self._auto_retry(lambda: self._make_get_request(
-            f"/{post_id}/insights?metric={','.join(metrics)}"
+            f"/{post_id}/insights?metric={_join_fields(metrics)}"
         ))["data"]
 
     def get_metrics_for_post(self, post_id, metrics):
@@ -229,14 +674,47 @@ class FacebookClient(object):
         :return: Requested metrics for this post, in the format metric -> value.
         :rtype: dict of str -> any
         """
-        raw_metrics = self._auto_retry(lambda: self.get_raw_metrics_for_post(post_id, metrics))
+        raw_metrics = self.get_raw_metrics_for_post(post_id, metrics)
+        return self._clean_metrics(raw_metrics)
+
+    def get_metrics_for_posts(self, post_ids, metrics):
+        """
+        Gets the metrics on many posts as simple dicts of metric -> value, using batch requests to fetch the metrics
+        for up to 50 posts per request.
 
-        cleaned_metrics = dict()
-        for m in raw_metrics:
-            assert len(m["values"]) == 1, f"Metric {m['name']} has {len(m['values'])} values, but " \
-                                          f"FacebookClient.get_metrics_for_post only expects one. " \
-                                          f"Use `FacebookClient.get_raw_metrics_for_post` instead or report" \
-                                          f"this to the developers of FacebookClient"
-            cleaned_metrics[m["name"]] = m["values"][0]["value"]
+        :param post_ids: Ids of posts to get metrics for.
+        :type post_ids: iterable of str
+        :param metrics: Metrics to request from Facebook. For the list of available metrics,
+                        see https://developers.facebook.com/docs/graph-api/reference/insights
+        :type metrics: iterable of str
+        :return: Dict of post id -> requested metrics for that post, in the format metric -> value.
+                 Fails with a FacebookError naming the posts whose metrics could not be fetched, if there were any.
+        :rtype: dict of str -> (dict of str -> any)
+        """
+        post_ids = list(post_ids)
+        log.info(f"Fetching metrics for {len(post_ids)} posts...")
+        metrics_str = _join_fields(metrics)
+        responses = self._make_batched_get_requests(
+            [f"{post_id}/insights?metric={metrics_str}" for post_id in post_ids])
+        self._raise_for_failed_posts(post_ids, responses)
+        log.info(f"Fetched metrics for {len(responses)} posts")
+
+        return {post_id: self._clean_metrics(response["data"]) for post_id, response in zip(post_ids, responses)}
+
+    @staticmethod
+    def _clean_metrics(raw_metrics):
+        """
+        Converts raw metrics in the format returned by Facebook to a simple dict of metric -> value.
+
+        :param raw_metrics: Metrics to clean, as returned by the Facebook API.
+        :type raw_metrics: list of dict
+        :return: `raw_metrics` in the format metric -> value.
+        :rtype: dict of str -> any
+        """
+        invalid = next((m for m in raw_metrics if len(m["values"]) != 1), None)
+        assert invalid is None, f"Metric {invalid['name']} has {len(invalid['values'])} values, but " \
+                                f"FacebookClient only supports cleaning metrics with one value. " \
+                                f"Use `FacebookClient.get_raw_metrics_for_post` instead or report " \
+                                f"this to the developers of FacebookClient"
 
-        return cleaned_metrics
+        return {m["name"]: m["values"][0]["value"] for m in raw_metrics}
@@ -1,57 +1,111 @@
+import re
+from collections.abc import Sized
+
+import ciso8601
 from core_data_modules.data_models import validators
 from core_data_modules.logging import Logger
 from core_data_modules.traced_data import TracedData, Metadata
 from core_data_modules.util import TimeUtils
-from dateutil.parser import isoparse
 
 log = Logger(__name__)
 
+_MAX_UUID_LOOKUPS_PER_BATCH = 500  # The maximum number of Facebook ids to look up in each call to data_to_uuid_batch
+
+# The format Facebook's APIs use for timestamps e.g. "2020-10-01T12:34:56+0000"
+_FACEBOOK_UTC_TIME_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\+0000")
+
 
 def clean_post_type(post):
     """
     Cleans Facebook post type
 
-    :param post: Facebook post in the format returned by Facebook's API.
+    :param post: Facebook post in the format returned by Facebook's API. Facebook omits 'attachments' from posts
+                 which don't have any, so posts without this key are treated as having no attachments.
     :type post: dict
     :return: "photo" | "video" | None
     :rtype: str | None
     """
     post_type = None
-    for attachment in post["attachments"]["data"]:
-        assert attachment["type"] in {"video_inline", "video_direct_response", "photo"}, post
-
-        if attachment["type"] in {"video_inline", "video_direct_response"}:
-            assert post_type in {"video", None}, post
-            post_type = "video"
-        elif attachment["type"] == "photo":
-            assert post_type in {"photo", None}, post
+    for attachment in post.get("attachments", {}).get("data", []):
+        attachment_type = attachment["type"]
+        if attachment_type == "photo":
+            assert post_type != "video", post
             post_type = "photo"
+        elif attachment_type == "video_inline" or attachment_type == "video_direct_response":
+            assert post_type != "photo", post
+            post_type = "video"
+        else:
+            assert False, post
 
     return post_type
 
 
+def _facebook_time_to_utc_iso_string(facebook_time):
+    """
+    Converts a timestamp returned by Facebook's APIs to an ISO 8601 string in UTC.
+
+    :param facebook_time: Timestamp to convert, as returned by Facebook.
+    :type facebook_time: str
+    :return: `facebook_time` as an ISO 8601 string in UTC, in the format returned by `datetime.isoformat`.
+    :rtype: str
+    """
+    # Facebook almost always returns timestamps in UTC with a '+0000' offset, which only differs from the format
+    # produced by `datetime.isoformat` by the offset separator, so rewrite those directly rather than parsing them.
+    if _FACEBOOK_UTC_TIME_REGEX.fullmatch(facebook_time):
+        return f"{facebook_time[:-5]}+00:00"
+
+    utc_iso_string = ciso8601.parse_datetime(facebook_time).isoformat()
+    validators.validate_utc_iso_string(utc_iso_string)
+    return utc_iso_string
+
+
 def convert_facebook_comments_to_traced_data(user, dataset_name, raw_comments, facebook_uuid_table):
-    log.info(f"Converting {len(raw_comments)} Facebook comments to TracedData...")
+    if isinstance(raw_comments, Sized):
+        log.info(f"Converting {len(raw_comments)} Facebook comments to TracedData...")
+    else:
+        log.info("Converting Facebook comments to TracedData...")
 
-    facebook_uuids = {comment["from"]["id"] for comment in raw_comments}
-    facebook_to_uuid_lut = facebook_uuid_table.data_to_uuid_batch(facebook_uuids)
+    # Comments all have (almost) the same keys, so cache the dataset-prefixed version of each key rather than
+    # re-formatting it for every comment.
+    prefixed_keys = dict()  # of comment key -> f"{dataset_name}.{comment key}"
 
-    traced_comments = []
-    # Use a placeholder avf facebook id for now, to make the individuals file work until we know if we'll be able
-    # to see Facebook user ids or not.
+    # Build each comment's dict and collect the commenters' ids in a single pass over the comments, so that
+    # `raw_comments` may be any iterable, including a stream of comments that is still being downloaded.
+    # The avf ids are filled in once all the commenters' ids are known and can be looked up together.
+    comment_dicts = []
+    facebook_ids = []
     for comment in raw_comments:
-        comment["created_time"] = isoparse(comment["created_time"]).isoformat()
-        validators.validate_utc_iso_string(comment["created_time"])
+        comment["created_time"] = _facebook_time_to_utc_iso_string(comment["created_time"])
 
         comment_dict = {
-            "avf_facebook_id": facebook_to_uuid_lut[comment["from"]["id"]]
+            "avf_facebook_id": None
         }
         for k, v in comment.items():
-            comment_dict[f"{dataset_name}.{k}"] = v
+            prefixed_key = prefixed_keys.get(k)
+            if prefixed_key is None:
+                prefixed_key = prefixed_keys[k] = f"{dataset_name}.{k}"
+            comment_dict[prefixed_key] = v
 
-        traced_comments.append(
-            TracedData(comment_dict,
-                       Metadata(user, Metadata.get_call_location(), TimeUtils.utc_now_as_iso_string())))
+        comment_dicts.append(comment_dict)
+        facebook_ids.append(comment["from"]["id"])
+
+    # Look up the unique ids in sorted chunks, to keep each request to the uuid table bounded in size.
+    unique_facebook_ids = sorted(set(facebook_ids))
+    facebook_to_uuid_lut = dict()
+    for i in range(0, len(unique_facebook_ids), _MAX_UUID_LOOKUPS_PER_BATCH):
+        facebook_to_uuid_lut.update(
+            facebook_uuid_table.data_to_uuid_batch(unique_facebook_ids[i:i + _MAX_UUID_LOOKUPS_PER_BATCH]))
+    get_uuid = facebook_to_uuid_lut.__getitem__
+
+    # Construct the metadata once for the whole batch, because finding the call location and the current time is
+    # expensive compared to building each comment, and gives the same result for every comment converted here.
+    metadata = Metadata(user, Metadata.get_call_location(), TimeUtils.utc_now_as_iso_string())
+    traced_comments = []
+    # Use a placeholder avf facebook id for now, to make the individuals file work until we know if we'll be able
+    # to see Facebook user ids or not.
+    for comment_dict, facebook_id in zip(comment_dicts, facebook_ids):
+        comment_dict["avf_facebook_id"] = get_uuid(facebook_id)
+        traced_comments.append(TracedData(comment_dict, metadata))
 
     log.info(f"Converted {len(traced_comments)} Facebook comments to TracedData")
 
@@ -0,0 +1,283 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from social_media_tools.facebook.facebook_client import FacebookClient, FacebookError
+
+
+class _StubResponse(object):
+    def __init__(self, body, status_code=200):
+        self.content = json.dumps(body).encode("utf-8")
+        self.status_code = status_code
+        self.headers = {}
+
+
+def _sub_response(body, code=200):
+    return {"code": code, "body": json.dumps(body)}
+
+
+class TestFacebookClientBatchRequests(unittest.TestCase):
+    def setUp(self):
+        self.client = FacebookClient("test-token")
+        self.batches = []  # of list of relative urls, for each batch request made
+
+    def _stub_session(self, respond):
+        """
+        Replaces the client's session with one that answers each batch request by calling `respond` on each of the
+        batch's relative urls.
+        """
+        def request(method, url, data=None, **kwargs):
+            self.assertEqual(method, "POST")
+            self.assertEqual(url, "https://graph.facebook.com/v8.0/")
+            self.assertEqual(data["include_headers"], "false")
+
+            batch = json.loads(data["batch"])
+            for sub_request in batch:
+                self.assertEqual(sub_request["method"], "GET")
+            relative_urls = [sub_request["relative_url"] for sub_request in batch]
+            self.batches.append(relative_urls)
+
+            return _StubResponse([respond(relative_url) for relative_url in relative_urls])
+
+        return mock.patch.object(self.client._session, "request", side_effect=request)
+
+    def test_get_posts(self):
+        post_ids = [str(i) for i in range(120)]
+
+        with self._stub_session(lambda url: _sub_response({"id": url.split("?")[0]})):
+            posts = self.client.get_posts(post_ids, fields=("message", "id"))
+
+        self.assertEqual([len(batch) for batch in self.batches], [50, 50, 20])
+        self.assertEqual(self.batches[0][0], "0?fields=message,id")
+        self.assertEqual(self.batches[2][-1], "119?fields=message,id")
+        self.assertEqual([post["id"] for post in posts], post_ids)
+
+    def test_get_metrics_for_posts(self):
+        def respond(url):
+            post_id = url.split("/")[0]
+            return _sub_response({"data": [
+                {"name": "post_impressions", "values": [{"value": int(post_id) * 10}]},
+                {"name": "post_clicks", "values": [{"value": int(post_id)}]}
+            ]})
+
+        with self._stub_session(respond):
+            metrics = self.client.get_metrics_for_posts(["1", "2"], ["post_impressions", "post_clicks"])
+
+        self.assertEqual(self.batches, [["1/insights?metric=post_impressions,post_clicks",
+                                         "2/insights?metric=post_impressions,post_clicks"]])
+        self.assertEqual(metrics, {
+            "1": {"post_impressions": 10, "post_clicks": 1},
+            "2": {"post_impressions": 20, "post_clicks": 2}
+        })
+
+    @mock.patch("time.sleep")
+    def test_only_failed_sub_requests_are_retried(self, _):
+        transient_failures = {"2?fields=id": 1}
+
+        def respond(url):
+            if url.startswith("3?"):
+                return _sub_response({"error": {"code": 100, "message": "Unsupported get request"}}, 400)
+            if transient_failures.get(url, 0) > 0:
+                transient_failures[url] -= 1
+                return _sub_response({"error": {"code": 2, "message": "Service temporarily unavailable"}}, 503)
+            return _sub_response({"id": url.split("?")[0]})
+
+        with self._stub_session(respond):
+            with self.assertRaises(FacebookError) as cm:
+                self.client.get_posts(["1", "2", "3"], fields=("id",))
+
+        self.assertEqual(self.batches, [["1?fields=id", "2?fields=id", "3?fields=id"], ["2?fields=id"]])
+        self.assertIn("'3'", cm.exception.message)
+        self.assertNotIn("'2'", cm.exception.message)
+
+    @mock.patch("time.sleep")
+    def test_whole_batch_failure_on_retry_is_reported(self, _):
+        responses = [
+            _StubResponse([_sub_response({"id": "1"}),
+                           _sub_response({"error": {"code": 2, "message": "Service temporarily unavailable"}}, 503)]),
+            _StubResponse({"error": {"code": 190, "message": "Invalid OAuth access token"}}, 400)
+        ]
+        with mock.patch.object(self.client._session, "request", side_effect=lambda *args, **kwargs: responses.pop(0)):
+            with self.assertRaises(FacebookError) as cm:
+                self.client.get_posts(["1", "2"], fields=("id",))
+
+        self.assertIn("Invalid OAuth access token", cm.exception.message)
+        self.assertNotIn("Service temporarily unavailable", cm.exception.message)
+
+    @mock.patch("time.sleep")
+    def test_non_json_sub_response_is_retried(self, _):
+        responses = [
+            _StubResponse([{"code": 502, "body": "<html>Bad Gateway</html>"}]),
+            _StubResponse([_sub_response({"id": "1"})])
+        ]
+        with mock.patch.object(self.client._session, "request", side_effect=lambda *args, **kwargs: responses.pop(0)):
+            posts = self.client.get_posts(["1"], fields=("id",))
+
+        self.assertEqual(posts, [{"id": "1"}])
+
+
+class TestFacebookClientRetries(unittest.TestCase):
+    def setUp(self):
+        self.client = FacebookClient("test-token")
+        self.requested_urls = []
+
+    def _stub_session(self, respond):
+        """
+        Replaces the client's session with one that answers each request with `respond(url)`.
+        """
+        def request(method, url, **kwargs):
+            self.requested_urls.append(url)
+            return respond(url)
+
+        return mock.patch.object(self.client._session, "request", side_effect=request)
+
+    @mock.patch("time.sleep")
+    def test_permanent_error_is_not_retried(self, sleep):
+        error = {"error": {"code": 190, "message": "Invalid OAuth access token"}}
+        with self._stub_session(lambda url: _StubResponse(error, 400)):
+            with self.assertRaises(FacebookError) as cm:
+                self.client.get_post("1")
+
+        self.assertEqual(cm.exception.code, 190)
+        self.assertFalse(cm.exception.is_transient)
+        self.assertEqual(len(self.requested_urls), 1)
+        sleep.assert_not_called()
+
+    @mock.patch("time.sleep")
+    def test_non_json_server_error_is_retried(self, sleep):
+        html_error = mock.Mock(content=b"<html>Service Unavailable</html>", status_code=503, headers={})
+        responses = [html_error, _StubResponse({"id": "1"})]
+        with self._stub_session(lambda url: responses.pop(0)):
+            post = self.client.get_post("1")
+
+        self.assertEqual(post, {"id": "1"})
+        self.assertEqual(len(self.requested_urls), 2)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1])
+
+    @mock.patch("time.sleep")
+    def test_rate_limit_backs_off_from_rate_limit_floor(self, sleep):
+        responses = [_StubResponse({"error": {"code": 17, "message": "User request limit reached"}}, 400),
+                     _StubResponse({"id": "1"})]
+        with self._stub_session(lambda url: responses.pop(0)):
+            self.client.get_post("1")
+
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [60])
+
+    @mock.patch("time.sleep")
+    def test_persistent_rate_limit_is_retried_by_a_single_retry_layer(self, sleep):
+        error = {"error": {"code": 17, "message": "User request limit reached"}}
+        with self._stub_session(lambda url: _StubResponse(error, 400)):
+            with self.assertRaises(FacebookError):
+                self.client.get_metrics_for_post("1", ["post_impressions"])
+
+        self.assertEqual(len(self.requested_urls), 6)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [60, 120, 240, 480, 960])
+
+    def test_error_classification(self):
+        self.assertTrue(FacebookError("", code=2).is_transient)
+        self.assertTrue(FacebookError("", code=613).is_rate_limit)
+        self.assertTrue(FacebookError("", code=1, is_transient=True).is_transient)
+        self.assertFalse(FacebookError("", code=100, http_status=500).is_transient)
+        self.assertTrue(FacebookError("", http_status=502).is_transient)
+        self.assertTrue(FacebookError("", http_status=429).is_rate_limit)
+        self.assertFalse(FacebookError("", http_status=404).is_transient)
+
+
+class TestFacebookClientPaging(unittest.TestCase):
+    def setUp(self):
+        self.client = FacebookClient("test-token")
+
+    @staticmethod
+    def _page(data, next_url=None):
+        page = {"data": data}
+        if next_url is not None:
+            page["paging"] = {"next": next_url}
+        return page
+
+    def _stub_session(self, respond):
+        """
+        Replaces the client's session with one that answers each request with `respond(url)`.
+        """
+        return mock.patch.object(self.client._session, "request",
+                                 side_effect=lambda method, url, **kwargs: respond(url))
+
+    @mock.patch("time.sleep")
+    def test_transient_prefetch_failure_is_retried(self, _):
+        pages = {
+            "page-2": [_StubResponse({"error": {"code": 2, "message": "Service temporarily unavailable"}}, 503),
+                       _StubResponse(self._page([{"id": "3"}], "page-3"))],
+            "page-3": [_StubResponse(self._page([{"id": "4"}]))]
+        }
+
+        def respond(url):
+            if url.startswith("https://graph.facebook.com/v8.0/"):
+                return _StubResponse(self._page([{"id": "1"}, {"id": "2"}], "page-2"))
+            return pages[url].pop(0)
+
+        with self._stub_session(respond):
+            comments = list(self.client.iter_all_comments_on_post("post"))
+
+        self.assertEqual([c["id"] for c in comments], ["1", "2", "3", "4"])
+
+    def test_permanent_prefetch_failure_raises(self):
+        def respond(url):
+            if url.startswith("https://graph.facebook.com/v8.0/"):
+                return _StubResponse(self._page([{"id": "1"}], "page-2"))
+            return _StubResponse({"error": {"code": 190, "message": "Invalid OAuth access token"}}, 400)
+
+        comments = self.client.iter_all_comments_on_post("post")
+        with self._stub_session(respond):
+            self.assertEqual(next(comments)["id"], "1")
+            with self.assertRaises(FacebookError) as cm:
+                next(comments)
+
+        self.assertEqual(cm.exception.code, 190)
+
+    def test_close_does_not_wait_for_prefetch(self):
+        prefetch_started = threading.Event()
+        release_prefetch = threading.Event()
+        self.addCleanup(release_prefetch.set)
+
+        def respond(url):
+            if url.startswith("https://graph.facebook.com/v8.0/"):
+                return _StubResponse(self._page([{"id": "1"}, {"id": "2"}], "page-2"))
+            prefetch_started.set()
+            release_prefetch.wait(10)
+            return _StubResponse(self._page([{"id": "3"}]))
+
+        with self._stub_session(respond):
+            comments = self.client.iter_all_comments_on_post("post")
+            self.assertEqual(next(comments)["id"], "1")
+            self.assertTrue(prefetch_started.wait(10))
+
+            start = time.monotonic()
+            comments.close()
+            self.assertLess(time.monotonic() - start, 1)
+
+    def test_session_is_not_used_concurrently(self):
+        active_requests = []
+        max_active_requests = [0]
+        active_lock = threading.Lock()
+
+        def respond(url):
+            with active_lock:
+                active_requests.append(url)
+                max_active_requests[0] = max(max_active_requests[0], len(active_requests))
+            time.sleep(0.05)
+            with active_lock:
+                active_requests.remove(url)
+
+            if url.startswith("https://graph.facebook.com/v8.0/post/"):
+                return _StubResponse(self._page([{"id": "1"}], "page-2"))
+            if url == "page-2":
+                return _StubResponse(self._page([{"id": "2"}]))
+            return _StubResponse({"id": "parent"})
+
+        with self._stub_session(respond):
+            for _ in self.client.iter_all_comments_on_post("post"):
+                # Use the client while the next page is being prefetched.
+                self.client.get_post("parent")
+
+        self.assertEqual(max_active_requests[0], 1)